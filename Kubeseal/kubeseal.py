@@ -1,22 +1,141 @@
 import sublime
 import sublime_plugin
 import subprocess
-import threading
 import os
 import re
+import html
+import shutil
+import functools
+import threading
+import collections
+import concurrent.futures
+
+# Shared worker pool for kubeseal subprocess calls
+_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+
+# Resolve the kubeseal binary once instead of on every Popen call
+_KUBESEAL_BIN = shutil.which('kubeseal') or 'kubeseal'
+
+# Extra Popen arguments: no console window on Windows, own session elsewhere
+# so signals sent to Sublime's process group don't cut kubeseal off mid-run.
+# close_fds is POSIX only: before Python 3.7 Windows rejects it together with
+# redirected stdin/stdout/stderr.
+if os.name == 'nt':
+    _POPEN_KW = {'creationflags': getattr(subprocess, 'CREATE_NO_WINDOW', 0x08000000)}
+else:
+    _POPEN_KW = {'close_fds': True, 'start_new_session': True}
+
+# Keyed on the path only. A cached True goes stale if the file is deleted or
+# replaced, so the cache is also cleared whenever kubeseal exits non-zero; the
+# next run then re-checks the file and reports it as missing if it's gone.
+@functools.lru_cache(maxsize=16)
+def _path_exists(path):
+    """Cached os.path.exists for the configured cert/key paths"""
+    return os.path.exists(path)
+
+# Recent encryption results keyed on (cert, cert mtime, namespace, name, text).
+# Note that the keys hold the plaintext secrets, which stay in memory for the
+# whole editor session (up to _ENCRYPT_CACHE_SIZE entries). This is accepted
+# to skip repeat kubeseal calls; decryption results are never cached.
+_ENCRYPT_CACHE = collections.OrderedDict()
+_ENCRYPT_CACHE_SIZE = 128
+_ENCRYPT_CACHE_LOCK = threading.Lock()
+
+def _cache_get(key):
+    """Return a cached encryption result or None"""
+    with _ENCRYPT_CACHE_LOCK:
+        value = _ENCRYPT_CACHE.get(key)
+        if value is not None:
+            _ENCRYPT_CACHE.move_to_end(key)
+        return value
+
+def _cache_put(key, value):
+    """Store an encryption result, evicting the oldest entry when full"""
+    with _ENCRYPT_CACHE_LOCK:
+        _ENCRYPT_CACHE[key] = value
+        _ENCRYPT_CACHE.move_to_end(key)
+        if len(_ENCRYPT_CACHE) > _ENCRYPT_CACHE_SIZE:
+            _ENCRYPT_CACHE.popitem(last=False)
+
+# A top-level metadata block: the header line plus every following line that
+# is blank, indented or a comment. Each line matches exactly one way, which
+# keeps the search linear.
+_METADATA_BLOCK_RE = re.compile(
+    r'^metadata:[^\S\n]*(?:#[^\n]*)?\n'
+    r'(?P<body>(?:\r?\n|(?:[ \t][^\n]*|#[^\n]*)(?:\n|\Z))*)',
+    re.MULTILINE
+)
+# The first key line of a block body fixes the indent of its direct children
+_METADATA_CHILD_INDENT_RE = re.compile(r'^([ \t]+)[^\s#]', re.MULTILINE)
+_METADATA_FIELD_RE = re.compile(
+    r'^(?P<indent>[ \t]+)(?P<key>name|namespace):[^\S\n]*(?P<value>[^\s#]\S*)',
+    re.MULTILINE
+)
+
+# How much of the buffer to scan for the metadata block before reading it all
+_METADATA_SCAN_SIZE = 8192
+
+# Minimal SealedSecret used for offline decryption
+_SEALED_SECRET_TMPL = """apiVersion: bitnami.com/v1alpha1
+kind: SealedSecret
+metadata:
+  name: {name}
+  namespace: {namespace}
+spec:
+  encryptedData:
+    data: {encrypted_data}
+  template:
+    metadata:
+      name: {name}
+      namespace: {namespace}
+"""
+
+# Popup markup for decrypted content
+_POPUP_HTML = """
+<body>
+<style>
+body {{ font-family: monospace; font-size: 12px; }}
+.header {{ color: #569cd6; font-weight: bold; margin-bottom: 10px; }}
+.content {{ background: #1e1e1e; color: #d4d4d4; padding: 10px; white-space: pre-wrap; }}
+</style>
+<div class="header">Decrypted Secret: {ns}/{name}</div>
+<div class="content">{body}</div>
+</body>
+"""
+
+# Parsed plugin settings, rebuilt whenever the settings file changes
+_SETTINGS = {}
+
+def _load_settings():
+    """Load plugin settings with defaults"""
+    global _SETTINGS
+    settings = sublime.load_settings("Kubeseal.sublime-settings")
+    _SETTINGS = {
+        'cert_path': settings.get('cert_path', ''),
+        'private_key_path': settings.get('private_key_path', ''),
+        'timeout': settings.get('timeout', 30),
+        'decrypt_output': settings.get('decrypt_output', 'new_tab')  # 'new_tab' or 'popup'
+    }
+    _path_exists.cache_clear()
+
+def plugin_loaded():
+    """Load settings once and reload them whenever they change"""
+    _load_settings()
+    sublime.load_settings("Kubeseal.sublime-settings").add_on_change('kubeseal', _load_settings)
+
+def plugin_unloaded():
+    """Stop the worker pool so a plugin reload doesn't leak threads"""
+    sublime.load_settings("Kubeseal.sublime-settings").clear_on_change('kubeseal')
+    _EXECUTOR.shutdown(wait=False)
 
 class KubesealCommand(sublime_plugin.TextCommand):
     """Base class for kubeseal operations"""
 
     def get_settings(self):
-        """Load plugin settings with defaults"""
-        settings = sublime.load_settings("Kubeseal.sublime-settings")
-        return {
-            'cert_path': settings.get('cert_path', ''),
-            'private_key_path': settings.get('private_key_path', ''),
-            'timeout': settings.get('timeout', 30),
-            'decrypt_output': settings.get('decrypt_output', 'new_tab')  # 'new_tab' or 'popup'
-        }
+        """Return the cached plugin settings"""
+        if not _SETTINGS:
+            _load_settings()
+        return _SETTINGS
 
     def show_error(self, message):
         """Display error message to user"""
@@ -28,39 +147,50 @@ class KubesealCommand(sublime_plugin.TextCommand):
 
     def extract_metadata_from_file(self):
         """Extract namespace and secret name from current file's YAML metadata"""
-        try:
-            file_content = self.view.substr(sublime.Region(0, self.view.size()))
-
-            namespace = None
-            secret_name = None
-
-            namespace_pattern = r'^\s*namespace:\s*([^\s\n]+)'
-            name_pattern = r'^\s*name:\s*([^\s\n]+)'
-
-            in_metadata = False
-            lines = file_content.split('\n')
-
-            for line in lines:
-                if re.match(r'^\s*metadata:\s*$', line):
-                    in_metadata = True
-                    continue
-
-                if in_metadata and re.match(r'^[a-zA-Z]', line):
-                    in_metadata = False
-
-                if in_metadata:
-                    namespace_match = re.match(namespace_pattern, line)
-                    if namespace_match:
-                        namespace = namespace_match.group(1).strip()
-
-                    name_match = re.match(name_pattern, line)
-                    if name_match:
-                        secret_name = name_match.group(1).strip()
-
-            return namespace, secret_name
-
-        except Exception as e:
-            return None, None
+        # The metadata block is almost always near the top, so only copy
+        # the head of the buffer and fall back to the whole file if needed
+        view_size = self.view.size()
+        size = min(view_size, _METADATA_SCAN_SIZE)
+        file_content = self.view.substr(sublime.Region(0, size))
+        if size < view_size:
+            # Drop the trailing partial line so a cut-off value isn't picked up
+            file_content = file_content[:file_content.rfind('\n') + 1]
+
+        namespace, secret_name = self._scan_metadata(file_content)
+
+        if (namespace is None or secret_name is None) and size < view_size:
+            file_content = self.view.substr(sublime.Region(0, view_size))
+            namespace, secret_name = self._scan_metadata(file_content)
+
+        return namespace, secret_name
+
+    def _scan_metadata(self, file_content):
+        """Scan YAML text for metadata namespace and name"""
+        # Both values come from the same block, the first one that has both;
+        # a multi-document file may hold e.g. a Namespace before the secret.
+        # Keys nested deeper (labels, annotations) are ignored.
+        #
+        # Manual check (the package has no test suite), expected results:
+        #   kind: Namespace / metadata: name: prod / --- / kind: SealedSecret /
+        #     metadata: name: db-creds, namespace: prod   -> ('prod', 'db-creds')
+        #   metadata: labels: name: lbl / namespace: bar  -> (None, None), prompts
+        #   metadata: labels: name: lbl / name: foo /
+        #     namespace: bar                              -> ('bar', 'foo')
+        for block in _METADATA_BLOCK_RE.finditer(file_content):
+            body = block.group('body')
+            indent = _METADATA_CHILD_INDENT_RE.search(body)
+            if not indent:
+                continue
+
+            fields = {}
+            for match in _METADATA_FIELD_RE.finditer(body):
+                if match.group('indent') == indent.group(1):
+                    fields.setdefault(match.group('key'), match.group('value'))
+
+            if 'namespace' in fields and 'name' in fields:
+                return fields['namespace'], fields['name']
+
+        return None, None
 
 class KubesealEncryptCommand(KubesealCommand):
     """Encrypt selected text using kubeseal raw mode"""
@@ -72,22 +202,21 @@ class KubesealEncryptCommand(KubesealCommand):
             self.show_error("Certificate path not configured. Please set 'cert_path' in settings.")
             return
 
-        if not os.path.exists(settings['cert_path']):
+        if not _path_exists(settings['cert_path']):
+            # Don't let a missing file stay cached once the user creates it
+            _path_exists.cache_clear()
             self.show_error("Certificate file not found: {}".format(settings['cert_path']))
             return
 
-        # Check if text is selected
-        has_selection = False
-        for region in self.view.sel():
-            if not region.empty():
-                has_selection = True
-                break
+        # Collect selected regions once, an empty list means nothing is selected
+        regions = [(r.begin(), r.end(), self.view.substr(r)) for r in self.view.sel() if not r.empty()]
 
-        if not has_selection:
+        if not regions:
             self.show_error("Please select text to encrypt")
             return
 
         self.settings = settings
+        self.regions = regions
 
         # Try to extract metadata from file
         namespace, secret_name = self.extract_metadata_from_file()
@@ -132,29 +261,37 @@ class KubesealEncryptCommand(KubesealCommand):
 
     def proceed_with_encryption(self, namespace, secret_name):
         """Proceed with encryption using provided namespace and secret name"""
-        self.show_status("Encrypting...")
+        # Read the cert mtime once per invocation, it's part of the cache key
+        try:
+            cert_mtime = os.path.getmtime(self.settings['cert_path'])
+        except OSError:
+            _path_exists.cache_clear()
+            self.show_error("Certificate file not found: {}".format(self.settings['cert_path']))
+            return
 
-        # Get all selected regions
-        self.regions = []
-        for region in self.view.sel():
-            if not region.empty():
-                self.regions.append({
-                    'region': region,
-                    'text': self.view.substr(region)
-                })
+        self.show_status("Encrypting...")
 
-        # Start encryption for first region
-        if self.regions:
-            threading.Thread(
-                target=self._encrypt_async,
-                args=(self.regions[0]['text'], namespace, secret_name, 0)
-            ).start()
+        # Encrypt all regions concurrently, results are applied once all are done.
+        # Batch state is per invocation since Sublime reuses this command instance.
+        batch = {'results': [], 'pending': len(self.regions), 'cert_mtime': cert_mtime}
+        for begin, end, text in self.regions:
+            _EXECUTOR.submit(self._encrypt_async, batch, text, namespace, secret_name, begin, end)
 
-    def _encrypt_async(self, text, namespace, secret_name, region_index):
+    def _encrypt_async(self, batch, text, namespace, secret_name, begin, end):
         """Perform encryption in background thread"""
         try:
+            cert_path = self.settings['cert_path']
+            key = (cert_path, batch['cert_mtime'], namespace, secret_name, text)
+            encrypted_text = _cache_get(key)
+            if encrypted_text is not None:
+                sublime.set_timeout(
+                    functools.partial(self._handle_encrypt_result, batch, encrypted_text, '', 0, begin, end, text),
+                    0
+                )
+                return
+
             cmd = [
-                'kubeseal', '--raw', '--cert', self.settings['cert_path'],
+                _KUBESEAL_BIN, '--raw', '--cert', self.settings['cert_path'],
                 '--namespace', namespace, '--name', secret_name
             ]
 
@@ -163,33 +300,67 @@ class KubesealEncryptCommand(KubesealCommand):
                 stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                universal_newlines=True
+                **_POPEN_KW
             )
 
-            encrypted_text, error = process.communicate(input=text)
+            try:
+                encrypted_text, error = process.communicate(
+                    input=text.encode('utf-8'),
+                    timeout=self.settings['timeout']
+                )
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+                raise Exception("kubeseal timed out after {} seconds".format(self.settings['timeout']))
+
+            encrypted_text = encrypted_text.decode('utf-8').strip()
+            error = error.decode('utf-8', 'replace')
+
+            return_code = process.returncode
+            if return_code == 0:
+                _cache_put(key, encrypted_text)
+            else:
+                _path_exists.cache_clear()
 
             sublime.set_timeout(
-                lambda: self._handle_encrypt_result(encrypted_text, error, process.returncode, region_index),
+                functools.partial(self._handle_encrypt_result, batch, encrypted_text, error, return_code, begin, end, text),
                 0
             )
 
         except Exception as e:
+            error = str(e)
             sublime.set_timeout(
-                lambda: self.show_error("Encryption failed: {}".format(str(e))), 
+                functools.partial(self._handle_encrypt_result, batch, None, error, -1, begin, end, text),
                 0
             )
 
-    def _handle_encrypt_result(self, encrypted_text, error, return_code, region_index):
+    def _handle_encrypt_result(self, batch, encrypted_text, error, return_code, begin, end, text):
         """Handle encryption result in main thread"""
-        if return_code == 0:
-            self.view.run_command('kubeseal_replace_text', {
-                'region_start': self.regions[region_index]['region'].begin(),
-                'region_end': self.regions[region_index]['region'].end(),
-                'new_text': encrypted_text.strip()
-            })
-            self.show_status("Text encrypted successfully")
+        batch['results'].append((begin, end, text, encrypted_text, error, return_code))
+        batch['pending'] -= 1
+        if batch['pending']:
+            return
+
+        # Replace from the last region backwards so earlier offsets stay valid
+        errors = []
+        results = sorted(batch['results'], key=lambda result: result[0], reverse=True)
+        for begin, end, text, encrypted_text, error, return_code in results:
+            if return_code == 0 and self.view.substr(sublime.Region(begin, end)) != text:
+                # The buffer was edited (or encrypted again) while kubeseal ran
+                errors.append("selection changed while encrypting, text left as is")
+            elif return_code == 0:
+                self.view.run_command('kubeseal_replace_text', {
+                    'region_start': begin,
+                    'region_end': end,
+                    'new_text': encrypted_text
+                })
+            else:
+                errors.append(error)
+
+        if errors:
+            self.show_error("Encryption failed: {}".format(errors[0]))
         else:
-            self.show_error("Encryption failed: {}".format(error))
+            self.show_status("Text encrypted successfully")
 
 class KubesealDecryptCommand(KubesealCommand):
     """Decrypt sealed secret using private key (offline) - shows result in new tab"""
@@ -201,7 +372,9 @@ class KubesealDecryptCommand(KubesealCommand):
             self.show_error("Private key path not configured. Please set 'private_key_path' in settings.")
             return
 
-        if not os.path.exists(settings['private_key_path']):
+        if not _path_exists(settings['private_key_path']):
+            # Don't let a missing file stay cached once the user creates it
+            _path_exists.cache_clear()
             self.show_error("Private key file not found: {}".format(settings['private_key_path']))
             return
 
@@ -219,7 +392,7 @@ class KubesealDecryptCommand(KubesealCommand):
             return
 
         self.settings = settings
-        self.selected_encrypted_text = selected_text
+        self.selected_encrypted_text = selected_text.strip()
 
         # Try to extract metadata from file
         namespace, secret_name = self.extract_metadata_from_file()
@@ -266,18 +439,15 @@ class KubesealDecryptCommand(KubesealCommand):
         """Proceed with decryption using provided namespace and secret name"""
         self.show_status("Decrypting...")
 
-        threading.Thread(
-            target=self._decrypt_async,
-            args=(self.selected_encrypted_text, namespace, secret_name)
-        ).start()
+        _EXECUTOR.submit(self._decrypt_async, self.selected_encrypted_text, namespace, secret_name)
 
     def _decrypt_async(self, encrypted_text, namespace, secret_name):
         """Perform offline decryption in background thread"""
         try:
-            sealed_secret_yaml = self._create_sealed_secret_yaml(encrypted_text.strip(), namespace, secret_name)
+            sealed_secret_yaml = self._create_sealed_secret_yaml(encrypted_text, namespace, secret_name)
 
             cmd = [
-                'kubeseal',
+                _KUBESEAL_BIN,
                 '--recovery-unseal',
                 '--recovery-private-key', self.settings['private_key_path']
             ]
@@ -287,42 +457,45 @@ class KubesealDecryptCommand(KubesealCommand):
                 stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                universal_newlines=True
+                **_POPEN_KW
             )
 
-            decrypted_output, error = process.communicate(input=sealed_secret_yaml)
+            try:
+                decrypted_output, error = process.communicate(
+                    input=sealed_secret_yaml.encode('utf-8'),
+                    timeout=self.settings['timeout']
+                )
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+                raise Exception("kubeseal timed out after {} seconds".format(self.settings['timeout']))
+
+            decrypted_output = decrypted_output.decode('utf-8')
+            error = error.decode('utf-8', 'replace')
+
+            return_code = process.returncode
+            if return_code != 0:
+                _path_exists.cache_clear()
 
             sublime.set_timeout(
-                lambda: self._handle_decrypt_result(decrypted_output, error, process.returncode, namespace, secret_name),
+                functools.partial(self._handle_decrypt_result, decrypted_output, error, return_code, namespace, secret_name),
                 0
             )
 
         except Exception as e:
+            message = "Decryption failed: {}".format(str(e))
             sublime.set_timeout(
-                lambda: self.show_error("Decryption failed: {}".format(str(e))), 
+                functools.partial(self.show_error, message),
                 0
             )
 
     def _create_sealed_secret_yaml(self, encrypted_text, namespace, secret_name):
         """Create minimal SealedSecret YAML from encrypted text"""
-        yaml_content = """apiVersion: bitnami.com/v1alpha1
-kind: SealedSecret
-metadata:
-  name: {name}
-  namespace: {namespace}
-spec:
-  encryptedData:
-    data: {encrypted_data}
-  template:
-    metadata:
-      name: {name}
-      namespace: {namespace}
-""".format(
-            encrypted_data=encrypted_text,
-            name=secret_name,
-            namespace=namespace
-        )
-        return yaml_content
+        return _SEALED_SECRET_TMPL.format_map({
+            'encrypted_data': encrypted_text,
+            'name': secret_name,
+            'namespace': namespace
+        })
 
     def _handle_decrypt_result(self, decrypted_output, error, return_code, namespace, secret_name):
         """Handle decryption result in main thread"""
@@ -342,22 +515,15 @@ spec:
         new_view = self.view.window().new_file()
         new_view.set_name("Decrypted Secret: {}/{}".format(namespace, secret_name))
         new_view.set_syntax_file("Packages/YAML/YAML.sublime-syntax")
-        new_view.run_command('kubeseal_insert_content', {'content': content})
+        new_view.run_command('append', {'characters': content, 'force': True, 'scroll_to_end': False})
 
     def _show_in_popup(self, content, namespace, secret_name):
         """Show decrypted content in a popup"""
-        # Format content for popup display
-        popup_content = """
-        <body>
-        <style>
-        body { font-family: monospace; font-size: 12px; }
-        .header { color: #569cd6; font-weight: bold; margin-bottom: 10px; }
-        .content { background: #1e1e1e; color: #d4d4d4; padding: 10px; white-space: pre-wrap; }
-        </style>
-        <div class="header">Decrypted Secret: {}/{}</div>
-        <div class="content">{}</div>
-        </body>
-        """.format(namespace, secret_name, content.replace('<', '&lt;').replace('>', '&gt;'))
+        popup_content = _POPUP_HTML.format(
+            ns=namespace,
+            name=secret_name,
+            body=html.escape(content, quote=False)
+        )
 
         self.view.show_popup(
             popup_content,
@@ -374,13 +540,6 @@ class KubesealReplaceTextCommand(sublime_plugin.TextCommand):
         region = sublime.Region(region_start, region_end)
         self.view.replace(edit, region, new_text)
 
-# Helper command for inserting content in new tab
-class KubesealInsertContentCommand(sublime_plugin.TextCommand):
-    """Helper command to insert content in a new tab"""
-
-    def run(self, edit, content):
-        self.view.insert(edit, 0, content)
-
 class KubesealOpenSettingsCommand(sublime_plugin.ApplicationCommand):
     """Open Kubeseal settings file"""
 